@@ -1,19 +1,48 @@
+import hashlib
 import logging
 import threading
-import time
-from typing import List, Dict, Any, Optional
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable
 from datetime import datetime
 
+from cachetools import LRUCache, TTLCache
+
 from services.email_service import EmailService
 from services.nlp_service import NLPService
+from services.response_cache import SemanticResponseCache
 from agents.email_agent import EmailAgent
 from knowledge.knowledge_base import KnowledgeBase
 from models.email_message import EmailMessage
 from models.student import Student
-from config.settings import OVERSIGHT_CONFIG
+from config.settings import EMAIL_CONFIG, OVERSIGHT_CONFIG, KB_CONFIG, CACHE_CONFIG
 
 logger = logging.getLogger(__name__)
 
+# Body of the email sent to the approver for each queued response
+APPROVAL_TEMPLATE = (
+    "The following student email needs your approval before sending a response:\n\n"
+    "FROM: {sender}\n"
+    "SUBJECT: {subject}\n"
+    "INTENT: {intent}\n"
+    "APPROVAL ID: {approval_id}\n\n"
+    "ORIGINAL MESSAGE:\n{body}\n\n"
+    "DRAFT RESPONSE:\n{draft}\n\n"
+    "To approve, reply with 'APPROVE'. To modify, reply with 'REVISE:' followed by your revised response."
+)
+
+class StudentCache(LRUCache):
+    """LRU cache of student records that hands evicted records to a callback."""
+    
+    def __init__(self, maxsize: int, on_evict: Callable[[Student], None]):
+        super().__init__(maxsize)
+        self.on_evict = on_evict
+    
+    def popitem(self):
+        key, student = super().popitem()
+        self.on_evict(student)
+        return key, student
+
 class CoordinatorAgent:
     """
     Coordinator Agent that orchestrates the entire system.
@@ -29,16 +58,56 @@ class CoordinatorAgent:
         # Initialize specialized agents
         self.email_agent = EmailAgent(knowledge_base, nlp_service)
         
+        # Caches of draft responses: exact resends first, then near-duplicate questions
+        self.exact_cache = TTLCache(maxsize=CACHE_CONFIG["exact_max_entries"], ttl=CACHE_CONFIG["ttl"])
+        self.response_cache = SemanticResponseCache()
+        
+        # Grade inquiries need human review unless the classification is confident
+        confidence_threshold = OVERSIGHT_CONFIG["confidence_threshold"]
+        
+        def handle_grade_inquiry(email_msg: EmailMessage, student: Student, intent: str, confidence: float,
+                                 draft_response: Optional[str] = None, embedding=None):
+            if confidence < confidence_threshold:
+                self._queue_for_approval(email_msg, student, intent, confidence, draft_response)
+            else:
+                self._handle_via_email_agent(email_msg, student, intent, confidence, draft_response, embedding)
+        
+        # Handlers for each canonical intent; anything else goes to the email agent
+        self._intent_dispatch = {
+            "assignment_question": self._handle_via_email_agent,
+            "conceptual_question": self._handle_via_email_agent,
+            "grade_inquiry": handle_grade_inquiry,
+            "administrative": self._handle_via_email_agent,
+            "technical_issue": self._handle_via_email_agent,
+            # Personal circumstances usually need human review
+            "personal_circumstance": self._queue_for_approval
+        }
+        
         # Initialize tracking variables
         self.active = False
         self.email_counter = 0
         self.max_emails_per_day = OVERSIGHT_CONFIG["max_auto_emails_per_day"]
         self.last_reset_date = datetime.now().date()
-        self.pending_approvals = []
-        self.students = {}  # Dictionary to store student information
+        self.pending_approvals: Dict[str, Dict[str, Any]] = {}  # Approval ID -> approval item
+        # Recently seen students; evicted records are written back to the knowledge base
+        self.students = StudentCache(KB_CONFIG["student_cache_size"], on_evict=self._mark_dirty)
+        
+        # Worker pool for processing emails in parallel; LLM and SMTP calls are I/O-bound
+        self.max_parallel_emails = EMAIL_CONFIG["max_parallel_emails"]
+        self.executor = ThreadPoolExecutor(max_workers=self.max_parallel_emails)
+        
+        # Write-back buffer of student records, keyed by email so repeated updates collapse
+        self._kb_dirty: Dict[str, Student] = {}
+        self._kb_flushing: Dict[str, Student] = {}  # Taken from the buffer but not yet written
+        self._kb_flush_timer: Optional[threading.Timer] = None
+        self.kb_flush_interval = KB_CONFIG["flush_interval"]
+        self.kb_flush_batch_size = KB_CONFIG["flush_batch_size"]
         
         # Initialize threading locks
         self.counter_lock = threading.Lock()
+        self.approvals_lock = threading.Lock()
+        self.kb_lock = threading.Lock()
+        self.exact_cache_lock = threading.Lock()
     
     def start(self):
         """Start the coordinator agent and all services."""
@@ -49,14 +118,12 @@ class CoordinatorAgent:
         logger.info("Starting coordinator agent")
         self.active = True
         
+        # A fresh pool, since stop() shuts the previous one down
+        self.executor = ThreadPoolExecutor(max_workers=self.max_parallel_emails)
+        
         # Start monitoring for new emails
         self.email_service.start_monitoring(self.handle_new_emails)
         
-        # Start a background thread for daily counter reset
-        self.counter_thread = threading.Thread(target=self._reset_counter_daily)
-        self.counter_thread.daemon = True
-        self.counter_thread.start()
-        
         logger.info("Coordinator agent started successfully")
     
     def stop(self):
@@ -70,9 +137,15 @@ class CoordinatorAgent:
         # Stop email monitoring
         self.email_service.stop_monitoring_emails()
         
+        # Let in-flight shards finish sending before their connections go away
+        self.executor.shutdown(wait=True)
+        
         # Disconnect from email servers
         self.email_service.disconnect()
         
+        # Write back any buffered student records
+        self._flush_dirty_students()
+        
         logger.info("Coordinator agent stopped")
     
     def handle_new_emails(self, emails: List[EmailMessage]):
@@ -82,6 +155,9 @@ class CoordinatorAgent:
         Args:
             emails: List of new email messages
         """
+        # Pass 1: keep student emails and look up their student records
+        student_emails = []
+        students = []
         for email_msg in emails:
             try:
                 # Check if this is a student email
@@ -92,44 +168,114 @@ class CoordinatorAgent:
                 logger.info(f"Processing email from {email_msg.sender_email}: {email_msg.subject}")
                 
                 # Get or create student record
-                student = self._get_or_create_student(email_msg.sender_email, email_msg.sender_name)
-                
-                # Classify the email intent
-                intent, confidence = self.nlp_service.classify_intent(email_msg.subject, email_msg.body)
-                
-                # Route the email based on intent
-                if "assignment" in intent or "conceptual" in intent:
-                    # Academic questions go to the email agent
-                    self._handle_via_email_agent(email_msg, student, intent, confidence)
-                    
-                elif "grade" in intent:
-                    # Grade inquiries might need human review
-                    if confidence < OVERSIGHT_CONFIG["confidence_threshold"]:
-                        self._queue_for_approval(email_msg, student, intent)
-                    else:
-                        self._handle_via_email_agent(email_msg, student, intent, confidence)
-                        
-                elif "administrative" in intent:
-                    # Administrative queries handled by email agent
-                    self._handle_via_email_agent(email_msg, student, intent, confidence)
-                    
-                elif "technical" in intent:
-                    # Technical issues handled by email agent
-                    self._handle_via_email_agent(email_msg, student, intent, confidence)
-                    
-                elif "personal" in intent:
-                    # Personal circumstances usually need human review
-                    self._queue_for_approval(email_msg, student, intent)
-                    
-                else:
-                    # Default to email agent for other intents
-                    self._handle_via_email_agent(email_msg, student, intent, confidence)
-                
+                students.append(self._get_or_create_student(email_msg.sender_email, email_msg.sender_name))
+                student_emails.append(email_msg)
+            
             except Exception as e:
                 logger.error(f"Error processing email {email_msg.message_id}: {str(e)}")
+        
+        if not student_emails:
+            return
+        
+        # Pass 2: answer exact resends from the fingerprint cache without touching any model
+        with self.exact_cache_lock:
+            results = [self.exact_cache.get(self._fingerprint(email_msg)) for email_msg in student_emails]
+        
+        for email_msg, result in zip(student_emails, results):
+            if result:
+                logger.info(f"Exact cache hit for email from {email_msg.sender_email}")
+        
+        # Pass 3: embed the remaining emails at once and reuse near-duplicate answers.
+        # The semantic cache is only an optimisation, so a failure here just means no hits.
+        embeddings = [None] * len(student_emails)
+        try:
+            # Emails with too little content of their own go straight to classification
+            pending = [
+                i for i, result in enumerate(results)
+                if not result and self.response_cache.is_cacheable(student_emails[i].body)
+            ]
+            pending_embeddings = self.response_cache.embed_batch(
+                [student_emails[i].subject for i in pending], [student_emails[i].body for i in pending]
+            ) if pending else []
+            
+            for i, embedding in zip(pending, pending_embeddings):
+                embeddings[i] = embedding
+                cached = self.response_cache.lookup(embedding)
+                
+                # Reuse the intent and draft of a near-duplicate question if we have one
+                if cached:
+                    logger.info(f"Semantic cache hit for email from {student_emails[i].sender_email}")
+                    draft_response = self.response_cache.personalize(cached, students[i].name)
+                    results[i] = (cached["intent"], cached["confidence"], draft_response)
+        except Exception as e:
+            logger.error(f"Error checking semantic cache for {len(student_emails)} emails: {str(e)}")
+            embeddings = [None] * len(student_emails)
+        
+        # Pass 4: classify every email still without a result together
+        misses = [i for i, result in enumerate(results) if not result]
+        if misses:
+            try:
+                classifications = self.nlp_service.classify_intent_batch(
+                    [student_emails[i].subject for i in misses], [student_emails[i].body for i in misses]
+                )
+            except Exception as e:
+                logger.error(f"Error classifying batch of {len(misses)} emails: {str(e)}")
+                classifications = [self._classify_one(student_emails[i]) for i in misses]
+            
+            for i, classification in zip(misses, classifications):
+                if classification:
+                    intent, confidence = classification
+                    results[i] = (intent, confidence, None)
+        
+        # Pass 5: dispatch in parallel, sharded by sender so each student's emails stay in order
+        shards = [[] for _ in range(self.max_parallel_emails)]
+        for i, (email_msg, student) in enumerate(zip(student_emails, students)):
+            if not results[i]:
+                # This email's own classification failed; the rest of the batch still goes out
+                continue
+            intent, confidence, draft_response = results[i]
+            shard = hash(email_msg.sender_email) % self.max_parallel_emails
+            shards[shard].append((email_msg, student, intent, confidence, draft_response, embeddings[i]))
+        
+        list(self.executor.map(self._process_shard, [shard for shard in shards if shard]))
+    
+    def _classify_one(self, email_msg: EmailMessage) -> Optional[tuple]:
+        """Classify a single email, returning None if classification fails."""
+        try:
+            return self.nlp_service.classify_intent_fast(email_msg.subject, email_msg.body)
+        except Exception as e:
+            logger.error(f"Error classifying email {email_msg.message_id}: {str(e)}")
+            return None
+    
+    def _process_shard(self, items: List[tuple]):
+        """Process one worker's share of a batch, in arrival order."""
+        for item in items:
+            self._process_one(*item)
+    
+    def _process_one(self, email_msg: EmailMessage, student: Student, intent: str, confidence: float,
+                     draft_response: Optional[str], embedding):
+        """
+        Dispatch a single email using its precomputed classification.
+        
+        Args:
+            email_msg: The email message to handle
+            student: The student record
+            intent: The classified intent
+            confidence: The confidence score of the intent classification
+            draft_response: Cached response for the email, if there was a cache hit
+            embedding: Semantic cache key for the email, if it was embedded
+        """
+        try:
+            # Route the email based on intent, defaulting to the email agent
+            handler = self._intent_dispatch.get(intent, self._handle_via_email_agent)
+            handler(email_msg, student, intent, confidence, draft_response=draft_response, embedding=embedding)
+            
+        except Exception as e:
+            logger.error(f"Error processing email {email_msg.message_id}: {str(e)}")
     
     def _handle_via_email_agent(self, email_msg: EmailMessage, student: Student, 
-                              intent: str, confidence: float):
+                              intent: str, confidence: float, draft_response: Optional[str] = None,
+                              embedding=None):
         """
         Handle an email using the Email Response Agent.
         
@@ -138,43 +284,62 @@ class CoordinatorAgent:
             student: The student record
             intent: The classified intent
             confidence: The confidence score of the intent classification
+            draft_response: Previously generated response to reuse (optional)
+            embedding: Semantic cache key to store the generated response under (optional)
         """
-        # Check daily email limit
+        # Check if human approval is required based on settings
+        if OVERSIGHT_CONFIG["require_approval"]:
+            self._queue_for_approval(email_msg, student, intent, confidence, draft_response, embedding)
+            return
+        
+        # Check the daily email limit and reserve a slot; all I/O happens outside the lock
         with self.counter_lock:
-            if self.email_counter >= self.max_emails_per_day:
-                logger.warning("Daily email limit reached, queuing for approval")
-                self._queue_for_approval(email_msg, student, intent)
-                return
+            # Reset the counter on the first email of a new day
+            today = datetime.now().date()
+            if today != self.last_reset_date:
+                self.email_counter = 0
+                self.last_reset_date = today
+                logger.info(f"Reset daily email counter for {today}")
             
-            # Check if human approval is required based on settings
-            if OVERSIGHT_CONFIG["require_approval"]:
-                self._queue_for_approval(email_msg, student, intent)
-                return
-            
-            # Increment the counter
-            self.email_counter += 1
+            quota_exceeded = self.email_counter >= self.max_emails_per_day
+            if not quota_exceeded:
+                self.email_counter += 1
         
-        # Generate a response using the email agent
-        response = self.email_agent.generate_response(email_msg, student, intent)
+        if quota_exceeded:
+            logger.warning("Daily email limit reached, queuing for approval")
+            self._queue_for_approval(email_msg, student, intent, confidence, draft_response, embedding)
+            return
         
-        # Send the response
-        if response:
-            success = self.email_service.send_response(email_msg, response)
+        success = False
+        try:
+            # Generate a response using the email agent unless one was cached
+            response = draft_response or self._generate_response(email_msg, student, intent, confidence, embedding)
             
-            if success:
-                logger.info(f"Sent response to {email_msg.sender_email}")
+            # Send the response
+            if response:
+                success = self.email_service.send_response(email_msg, response)
                 
-                # Update student conversation history
-                student.update_conversation(email_msg, response, intent)
-                
-                # Update student record in knowledge base
-                self.knowledge_base.update_student(student)
+                if success:
+                    logger.info(f"Sent response to {email_msg.sender_email}")
+                    
+                    # Update student conversation history
+                    student.update_conversation(email_msg, response, intent)
+                    
+                    # Schedule the student record for write-back to the knowledge base
+                    self._mark_dirty(student)
+                else:
+                    logger.error(f"Failed to send response to {email_msg.sender_email}")
             else:
-                logger.error(f"Failed to send response to {email_msg.sender_email}")
-        else:
-            logger.warning(f"No response generated for email from {email_msg.sender_email}")
+                logger.warning(f"No response generated for email from {email_msg.sender_email}")
+        finally:
+            # Give the reserved slot back if nothing was sent
+            if not success:
+                with self.counter_lock:
+                    self.email_counter = max(0, self.email_counter - 1)
     
-    def _queue_for_approval(self, email_msg: EmailMessage, student: Student, intent: str):
+    def _queue_for_approval(self, email_msg: EmailMessage, student: Student, intent: str,
+                            confidence: float = 0.0, draft_response: Optional[str] = None,
+                            embedding=None):
         """
         Queue an email for human approval.
         
@@ -182,12 +347,18 @@ class CoordinatorAgent:
             email_msg: The email message to queue
             student: The student record
             intent: The classified intent
+            confidence: The confidence score of the intent classification
+            draft_response: Previously generated response to reuse (optional)
+            embedding: Semantic cache key to store the generated response under (optional)
         """
-        # Generate a draft response
-        draft_response = self.email_agent.generate_response(email_msg, student, intent)
+        # Generate a draft response unless one was cached
+        if not draft_response:
+            draft_response = self._generate_response(email_msg, student, intent, confidence, embedding)
         
         # Add to pending approvals queue
+        approval_id = uuid.uuid4().hex
         approval_item = {
+            "id": approval_id,
             "email": email_msg,
             "student": student,
             "intent": intent,
@@ -195,7 +366,8 @@ class CoordinatorAgent:
             "timestamp": datetime.now()
         }
         
-        self.pending_approvals.append(approval_item)
+        with self.approvals_lock:
+            self.pending_approvals[approval_id] = approval_item
         
         # If there's an approval email configured, send the draft there
         if OVERSIGHT_CONFIG["approval_email"]:
@@ -203,6 +375,38 @@ class CoordinatorAgent:
         
         logger.info(f"Queued email from {email_msg.sender_email} for approval")
     
+    def _generate_response(self, email_msg: EmailMessage, student: Student, intent: str,
+                           confidence: float, embedding=None) -> Optional[str]:
+        """
+        Generate a response with the email agent and cache it for repeated and similar emails.
+        
+        Args:
+            email_msg: The email message to respond to
+            student: The student record
+            intent: The classified intent
+            confidence: The confidence score of the intent classification
+            embedding: Semantic cache key to store the response under (optional)
+        
+        Returns:
+            str: The generated response, or None if none was generated
+        """
+        response = self.email_agent.generate_response(email_msg, student, intent)
+        
+        if response:
+            with self.exact_cache_lock:
+                self.exact_cache[self._fingerprint(email_msg)] = (intent, confidence, response)
+            
+            if embedding is not None:
+                self.response_cache.add(embedding, intent, confidence, response, student.name)
+        
+        return response
+    
+    @staticmethod
+    def _fingerprint(email_msg: EmailMessage) -> bytes:
+        """Exact-match cache key for an email; includes the sender so drafts never cross students."""
+        content = f"{email_msg.sender_email}\x00{email_msg.subject}\x00{email_msg.body}"
+        return hashlib.blake2b(content.encode(), digest_size=16).digest()
+    
     def _send_for_approval(self, approval_item: Dict[str, Any]):
         """
         Send an email for approval to the designated approval email address.
@@ -217,13 +421,14 @@ class CoordinatorAgent:
         # Create approval email content
         subject = f"APPROVAL NEEDED: Response to {email_msg.sender_name} - {intent}"
         
-        body = f"The following student email needs your approval before sending a response:\n\n"
-        body += f"FROM: {email_msg.sender}\n"
-        body += f"SUBJECT: {email_msg.subject}\n"
-        body += f"INTENT: {intent}\n\n"
-        body += f"ORIGINAL MESSAGE:\n{email_msg.body}\n\n"
-        body += f"DRAFT RESPONSE:\n{draft_response}\n\n"
-        body += f"To approve, reply with 'APPROVE'. To modify, reply with 'REVISE:' followed by your revised response."
+        body = APPROVAL_TEMPLATE.format(
+            sender=email_msg.sender,
+            subject=email_msg.subject,
+            intent=intent,
+            approval_id=approval_item["id"],
+            body=email_msg.body,
+            draft=draft_response
+        )
         
         # Send approval request
         self.email_service.send_email(
@@ -232,22 +437,25 @@ class CoordinatorAgent:
             body=body
         )
     
-    def approve_response(self, approval_id: int, revised_response: Optional[str] = None):
+    def approve_response(self, approval_id: str, revised_response: Optional[str] = None):
         """
         Approve a queued response.
         
         Args:
-            approval_id: The index of the approval item in the queue
+            approval_id: The ID of the approval item in the queue
             revised_response: Optional revised response text
         
         Returns:
             bool: True if approved and sent successfully, False otherwise
         """
-        if approval_id < 0 or approval_id >= len(self.pending_approvals):
+        # Take the item out of the queue so a concurrent approval can't send it twice
+        with self.approvals_lock:
+            approval_item = self.pending_approvals.pop(approval_id, None)
+        
+        if approval_item is None:
             logger.error(f"Invalid approval ID: {approval_id}")
             return False
         
-        approval_item = self.pending_approvals[approval_id]
         email_msg = approval_item["email"]
         student = approval_item["student"]
         intent = approval_item["intent"]
@@ -264,17 +472,64 @@ class CoordinatorAgent:
             # Update student conversation history
             student.update_conversation(email_msg, response, intent)
             
-            # Update student record in knowledge base
-            self.knowledge_base.update_student(student)
-            
-            # Remove from pending approvals
-            self.pending_approvals.pop(approval_id)
+            # Schedule the student record for write-back to the knowledge base
+            self._mark_dirty(student)
             
             return True
         else:
             logger.error(f"Failed to send approved response to {email_msg.sender_email}")
+            
+            # Put the item back so it can be approved again
+            with self.approvals_lock:
+                self.pending_approvals[approval_id] = approval_item
+            
             return False
     
+    def _mark_dirty(self, student: Student):
+        """
+        Buffer a student record for writing to the knowledge base. Buffered records
+        are flushed after a short delay, or immediately once the buffer is full.
+        
+        Args:
+            student: The student record that changed
+        """
+        with self.kb_lock:
+            self._kb_dirty[student.email] = student
+            flush_now = len(self._kb_dirty) >= self.kb_flush_batch_size
+            
+            if not flush_now and self._kb_flush_timer is None:
+                self._kb_flush_timer = threading.Timer(self.kb_flush_interval, self._flush_dirty_students)
+                self._kb_flush_timer.daemon = True
+                self._kb_flush_timer.start()
+        
+        if flush_now:
+            self._flush_dirty_students()
+    
+    def _flush_dirty_students(self):
+        """Write all buffered student records to the knowledge base."""
+        with self.kb_lock:
+            dirty, self._kb_dirty = self._kb_dirty, {}
+            # Keep records visible to _get_or_create_student until they are written
+            self._kb_flushing.update(dirty)
+            if self._kb_flush_timer:
+                self._kb_flush_timer.cancel()
+                self._kb_flush_timer = None
+        
+        for email, student in dirty.items():
+            try:
+                self.knowledge_base.update_student(student)
+                written = True
+            except Exception as e:
+                logger.error(f"Error updating student {student.email} in knowledge base: {str(e)}")
+                written = False
+            
+            with self.kb_lock:
+                if self._kb_flushing.get(email) is student:
+                    del self._kb_flushing[email]
+                # Failed writes go back in the buffer for the next flush
+                if not written:
+                    self._kb_dirty.setdefault(email, student)
+    
     def _get_or_create_student(self, email: str, name: str = "") -> Student:
         """
         Get or create a student record.
@@ -289,8 +544,14 @@ class CoordinatorAgent:
         if email in self.students:
             return self.students[email]
         
+        # An evicted record may still be waiting for (or in the middle of) write-back;
+        # the KB copy would be stale
+        with self.kb_lock:
+            student = self._kb_dirty.get(email) or self._kb_flushing.get(email)
+        
         # Try to get from knowledge base
-        student = self.knowledge_base.get_student(email)
+        if not student:
+            student = self.knowledge_base.get_student(email)
         
         if not student:
             # Create new student record
@@ -301,22 +562,3 @@ class CoordinatorAgent:
         self.students[email] = student
         
         return student
-    
-    def _reset_counter_daily(self):
-        """Background thread function to reset the email counter daily."""
-        while self.active:
-            try:
-                current_date = datetime.now().date()
-                
-                # Reset counter if it's a new day
-                if current_date != self.last_reset_date:
-                    with self.counter_lock:
-                        self.email_counter = 0
-                        self.last_reset_date = current_date
-                        logger.info(f"Reset daily email counter for {current_date}")
-            
-            except Exception as e:
-                logger.error(f"Error in counter reset thread: {str(e)}")
-            
-            # Sleep for a while (check every hour)
-            time.sleep(3600)
\ No newline at end of file
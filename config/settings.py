@@ -13,6 +13,10 @@ EMAIL_CONFIG = {
     "username": os.getenv("EMAIL_USERNAME"),
     "password": os.getenv("EMAIL_PASSWORD"),
     "check_frequency": int(os.getenv("EMAIL_CHECK_FREQUENCY", 300)),  # in seconds
+    "max_parallel_emails": int(os.getenv("MAX_PARALLEL_EMAILS", 4)),
+    "smtp_pool_size": int(os.getenv("EMAIL_SMTP_POOL_SIZE", os.getenv("MAX_PARALLEL_EMAILS", 4))),
+    "max_attachment_size": int(os.getenv("MAX_ATTACHMENT_SIZE", 10 * 1024 * 1024)),  # in bytes
+    "state_path": os.getenv("EMAIL_STATE_PATH", "data/email_state.json"),  # last seen UID
     "student_domain": os.getenv("STUDENT_EMAIL_DOMAIN", "university.edu")
 }
 
@@ -22,6 +26,11 @@ AI_CONFIG = {
     "api_key": os.getenv("OPENAI_API_KEY"),
     "max_tokens": int(os.getenv("MAX_TOKENS", 500)),
     "temperature": float(os.getenv("TEMPERATURE", 0.7)),
+    "intent_base_model": os.getenv("INTENT_BASE_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+    "intent_model_path": os.getenv("INTENT_MODEL_PATH", "data/intent_classifier"),
+    "intent_confidence_threshold": float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", 0.55)),
+    "intent_cache_size": int(os.getenv("INTENT_CACHE_SIZE", 10000)),
+    "intent_batch_size": int(os.getenv("INTENT_BATCH_SIZE", 20)),  # Emails per Claude classification call
     "system_prompt_template": """
 You are a helpful teaching assistant for {course_name}. 
 You are responding to student emails on behalf of {ta_name}, the course TA.
@@ -66,5 +75,18 @@ OVERSIGHT_CONFIG = {
 KB_CONFIG = {
     "materials_path": os.getenv("MATERIALS_PATH", "data/course_materials"),
     "templates_path": os.getenv("TEMPLATES_PATH", "data/templates"),
-    "kb_path": os.getenv("KB_PATH", "data/knowledge_base")
-}
\ No newline at end of file
+    "kb_path": os.getenv("KB_PATH", "data/knowledge_base"),
+    "flush_interval": float(os.getenv("KB_FLUSH_INTERVAL", 0.1)),  # in seconds
+    "flush_batch_size": int(os.getenv("KB_FLUSH_BATCH_SIZE", 100)),
+    "student_cache_size": int(os.getenv("STUDENT_CACHE_SIZE", 512))
+}
+
+# Response cache configuration
+CACHE_CONFIG = {
+    "embedding_model": os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+    "similarity_threshold": float(os.getenv("CACHE_SIMILARITY_THRESHOLD", 0.92)),
+    "max_entries": int(os.getenv("CACHE_MAX_ENTRIES", 5000)),
+    "exact_max_entries": int(os.getenv("EXACT_CACHE_MAX_ENTRIES", 4096)),
+    "min_body_chars": int(os.getenv("CACHE_MIN_BODY_CHARS", 20)),  # Shorter bodies skip the semantic cache
+    "ttl": int(os.getenv("CACHE_TTL", 86400))  # in seconds
+}
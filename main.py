@@ -1,4 +1,6 @@
 import logging
+import signal
+import threading
 from agents.coordinator import CoordinatorAgent
 from services.email_service import EmailService
 from services.nlp_service import NLPService
@@ -23,18 +25,20 @@ def main():
         knowledge_base=knowledge_base
     )
     
+    # Shut down on Ctrl+C or on SIGTERM from systemd/Docker
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    
     # Start the system
     coordinator.start()
     
-    try:
-        # Keep the main thread running
-        import time
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        # Graceful shutdown
-        coordinator.stop()
-        print("System shutdown")
+    # Block the main thread until a shutdown signal arrives
+    stop_event.wait()
+    
+    # Graceful shutdown
+    coordinator.stop()
+    print("System shutdown")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,8 +1,12 @@
+from bisect import bisect_left
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
+from operator import itemgetter
 from typing import List, Optional, Dict, Any
 
-@dataclass
+_deadline_date = itemgetter("date")
+
+@dataclass(slots=True)
 class Course:
     """Data model for a course."""
     name: str
@@ -16,19 +20,19 @@ class Course:
     policies: Dict[str, str] = field(default_factory=dict)
     resources: Dict[str, str] = field(default_factory=dict)
     
+    def __post_init__(self):
+        # Parse deadline dates once and keep deadlines sorted so lookups can bisect
+        for deadline in self.deadlines:
+            if isinstance(deadline["date"], str):
+                deadline["date"] = datetime.fromisoformat(deadline["date"])
+        self.deadlines.sort(key=_deadline_date)
+    
     def get_upcoming_deadlines(self, days: int = 7) -> List[Dict[str, Any]]:
         """Get deadlines coming up within specified number of days."""
         now = datetime.now()
-        upcoming = []
         
-        for deadline in self.deadlines:
-            if isinstance(deadline["date"], str):
-                deadline_date = datetime.fromisoformat(deadline["date"])
-            else:
-                deadline_date = deadline["date"]
-                
-            delta = (deadline_date - now).days
-            if 0 <= delta <= days:
-                upcoming.append(deadline)
-                
-        return upcoming
\ No newline at end of file
+        # Deadlines whose (date - now).days falls in [0, days]
+        start = bisect_left(self.deadlines, now, key=_deadline_date)
+        end = bisect_left(self.deadlines, now + timedelta(days=days + 1), key=_deadline_date)
+        
+        return self.deadlines[start:end]
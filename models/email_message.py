@@ -1,8 +1,16 @@
+import email
 from dataclasses import dataclass, field
 from datetime import datetime
+from itertools import islice
 from typing import List, Optional, Dict, Any
 
-@dataclass
+from config.settings import EMAIL_CONFIG
+
+# Student addresses end in "@domain", or ".domain" for department subdomains
+_STUDENT_DOMAIN = EMAIL_CONFIG["student_domain"].lower()
+_STUDENT_DOMAIN_SUFFIXES = ("@" + _STUDENT_DOMAIN, "." + _STUDENT_DOMAIN)
+
+@dataclass(slots=True)
 class EmailMessage:
     """Data model for an email message."""
     message_id: str
@@ -11,30 +19,44 @@ class EmailMessage:
     recipient: str
     body: str
     date: datetime
-    raw_content: str = field(repr=False)  # Full raw email content
+    raw_content: bytes = field(repr=False)  # Full raw email bytes, decoded only on demand
     cc: List[str] = field(default_factory=list)
-    attachments: List[Dict[str, Any]] = field(default_factory=list)
+    attachments: List[Dict[str, Any]] = field(default_factory=list)  # Metadata; payloads load lazily
     references: Optional[str] = None  # Reference to previous messages in thread
     in_reply_to: Optional[str] = None  # Direct reference to message being replied to
     thread_id: Optional[str] = None  # Thread ID for grouping conversations
     
-    @property
-    def sender_name(self) -> str:
-        """Extract name from sender email"""
-        if '<' in self.sender:
-            return self.sender.split('<')[0].strip()
-        return self.sender.split('@')[0]
+    # Derived from sender once in __post_init__; slots leave no __dict__ for cached_property
+    sender_name: str = field(init=False, repr=False, compare=False)
+    sender_email: str = field(init=False, repr=False, compare=False)
+    is_student_email: bool = field(init=False, repr=False, compare=False)
     
-    @property
-    def sender_email(self) -> str:
-        """Extract email address from sender"""
+    def __post_init__(self):
+        # Split "Name <address>" into its parts
         if '<' in self.sender:
-            return self.sender.split('<')[1].split('>')[0]
-        return self.sender
+            self.sender_name = self.sender.split('<')[0].strip()
+            self.sender_email = self.sender.split('<')[1].split('>')[0]
+        else:
+            self.sender_name = self.sender.split('@')[0]
+            self.sender_email = self.sender
+        
+        # Check if email is from a student based on domain
+        self.is_student_email = self.sender_email.lower().endswith(_STUDENT_DOMAIN_SUFFIXES)
     
-    @property
-    def is_student_email(self) -> bool:
-        """Check if email is from a student based on domain"""
-        from config.settings import EMAIL_CONFIG
-        student_domain = EMAIL_CONFIG["student_domain"]
-        return student_domain in self.sender_email
\ No newline at end of file
+    def load_attachment(self, index: int) -> Optional[bytes]:
+        """
+        Decode the payload of an attachment on first access, re-parsing raw_content
+        so no parsed copy of the message has to be kept around.
+        
+        Returns None for attachments skipped for exceeding max_attachment_size.
+        """
+        attachment = self.attachments[index]
+        if "data" not in attachment:
+            part_index = attachment["part_index"]
+            if part_index is None:
+                attachment["data"] = None
+            else:
+                msg = email.message_from_bytes(self.raw_content)
+                part = next(islice(msg.walk(), part_index, None))
+                attachment["data"] = part.get_payload(decode=True)
+        return attachment["data"]
\ No newline at end of file
@@ -1,23 +1,34 @@
+from collections import deque
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from itertools import islice
+from typing import Deque, List, Optional, Dict, Any
 from .email_message import EmailMessage
 
-@dataclass
+# Number of interactions kept per student; older ones are dropped
+MAX_HISTORY = 200
+
+@dataclass(slots=True, eq=False)
 class Student:
     """Data model for a student."""
     email: str
     name: str = ""
     student_id: Optional[str] = None
     enrolled_sections: List[str] = field(default_factory=list)
-    conversation_history: List[Dict[str, Any]] = field(default_factory=list)
+    conversation_history: Deque[Dict[str, Any]] = field(default_factory=lambda: deque(maxlen=MAX_HISTORY))
     last_interaction: Optional[datetime] = None
     metadata: Dict[str, Any] = field(default_factory=dict)
     
+    def __post_init__(self):
+        # Records loaded from the knowledge base may carry a plain list
+        if not isinstance(self.conversation_history, deque):
+            self.conversation_history = deque(self.conversation_history, maxlen=MAX_HISTORY)
+    
     def update_conversation(self, message: EmailMessage, response: str, intent: str = None):
         """Add a message and response to the conversation history."""
+        now = datetime.now()
         interaction = {
-            "timestamp": datetime.now(),
+            "timestamp": now,
             "message": {
                 "subject": message.subject,
                 "body": message.body
@@ -27,8 +38,9 @@ class Student:
         }
         
         self.conversation_history.append(interaction)
-        self.last_interaction = datetime.now()
+        self.last_interaction = now
     
     def get_recent_conversations(self, limit: int = 5) -> List[Dict[str, Any]]:
         """Get recent conversation history, limited to specified number."""
-        return self.conversation_history[-limit:] if self.conversation_history else []
+        start = max(0, len(self.conversation_history) - limit)
+        return list(islice(self.conversation_history, start, None))
@@ -1,13 +1,22 @@
 import imaplib
 import smtplib
 import email
+import json
 import logging
+import os
+import queue
+import re
+import select
+import socket
+import ssl
 import time
+from email import encoders
+from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.header import decode_header
+from email.header import decode_header, make_header
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Optional, Tuple, Any, Callable
 import threading
 
 from config.settings import EMAIL_CONFIG, COURSE_INFO
@@ -15,6 +24,24 @@ from models.email_message import EmailMessage
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of messages requested in a single IMAP FETCH
+FETCH_CHUNK_SIZE = 200
+
+# UID of a message in a FETCH response envelope
+_FETCH_UID_RE = re.compile(rb"\bUID (\d+)")
+
+# Re-issue IDLE well before servers drop idle sessions (RFC 2177 allows 29 minutes)
+IDLE_TIMEOUT = 25 * 60
+
+# How often an IDLE wait checks whether monitoring was stopped
+IDLE_STOP_CHECK_INTERVAL = 5
+
+# Seconds of silence before the OS starts probing an idle connection
+TCP_KEEPALIVE_IDLE = 30
+
+# How often the idle SMTP connection is pinged to keep it open
+SMTP_HEARTBEAT_INTERVAL = 5 * 60
+
 class EmailService:
     """Service for handling email operations: retrieving and sending emails."""
     
@@ -27,11 +54,33 @@ class EmailService:
         self.password = EMAIL_CONFIG["password"]
         self.check_frequency = EMAIL_CONFIG["check_frequency"]
         self.student_domain = EMAIL_CONFIG["student_domain"]
+        self.max_attachment_size = EMAIL_CONFIG["max_attachment_size"]
+        
+        # Course info is static, so the personalized signature is formatted once
+        self._signature = COURSE_INFO["email_signature"].format(
+            ta_name=COURSE_INFO["ta_name"],
+            course_name=COURSE_INFO["name"]
+        ) if COURSE_INFO.get("email_signature") else ""
         
         self.imap_client = None
-        self.smtp_client = None
+        # smtplib connections are not thread-safe, so each concurrent send checks
+        # out its own session; empty slots connect lazily on first use
+        self.smtp_pool_size = max(1, EMAIL_CONFIG["smtp_pool_size"])
+        self.smtp_pool = queue.LifoQueue()
+        for _ in range(self.smtp_pool_size):
+            self.smtp_pool.put(None)
         self.last_check_time = datetime.now() - timedelta(days=1)
+        
+        # Highest UID already handled; only valid while the mailbox UIDVALIDITY is unchanged
+        self.state_path = EMAIL_CONFIG["state_path"]
+        self.uidvalidity = None
+        self.last_uid = 0
+        self._load_state()
+        
+        # Highest UID fetched but not yet handled by the callback
+        self._fetched_uid = self.last_uid
         self.monitoring_thread = None
+        self.heartbeat_thread = None
         self.stop_monitoring = threading.Event()
         self.new_email_callback = None
     
@@ -39,29 +88,93 @@ class EmailService:
         """Connect to the IMAP server."""
         try:
             self.imap_client = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
+            self._enable_keepalive(self.imap_client.socket())
             self.imap_client.login(self.username, self.password)
+            self._select_inbox()
             logger.info(f"Connected to IMAP server {self.imap_server}")
             return True
         except Exception as e:
             logger.error(f"Failed to connect to IMAP server: {str(e)}")
+            # Don't keep a half-open client around; the next fetch must reconnect
+            if self.imap_client:
+                try:
+                    self.imap_client.shutdown()
+                except Exception:
+                    pass
+            self.imap_client = None
             return False
     
-    def connect_smtp(self) -> bool:
-        """Connect to the SMTP server."""
+    def _select_inbox(self):
+        """Select the inbox, discarding the saved last UID if the server renumbered it."""
+        # Read-only: the service never changes flags or expunges
+        self.imap_client.select("INBOX", readonly=True)
+        _, data = self.imap_client.response("UIDVALIDITY")
+        uidvalidity = int(data[0]) if data and data[0] else None
+        
+        if uidvalidity != self.uidvalidity:
+            if self.uidvalidity is not None:
+                logger.warning("Mailbox UIDVALIDITY changed, resyncing from last check time")
+            self.uidvalidity = uidvalidity
+            self.last_uid = 0
+            self._fetched_uid = 0
+    
+    def commit_fetched_emails(self):
+        """Mark everything returned by the last fetch as handled and persist it."""
+        if self._fetched_uid > self.last_uid:
+            self.last_uid = self._fetched_uid
+            self._save_state()
+    
+    def _load_state(self):
+        """Load the last seen UID saved by a previous run."""
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            self.uidvalidity = state.get("uidvalidity")
+            self.last_uid = state.get("last_uid", 0)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error loading email state: {str(e)}")
+    
+    def _save_state(self):
+        """Persist the last handled UID so a restart doesn't refetch processed emails."""
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"uidvalidity": self.uidvalidity, "last_uid": self.last_uid}, f)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            logger.error(f"Error saving email state: {str(e)}")
+    
+    def connect_smtp(self) -> Optional[smtplib.SMTP]:
+        """Open a new SMTP session, or return None if the connection fails."""
         try:
-            self.smtp_client = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            self.smtp_client.ehlo()
-            self.smtp_client.starttls()
-            self.smtp_client.ehlo()
-            self.smtp_client.login(self.username, self.password)
+            smtp_client = smtplib.SMTP(self.smtp_server, self.smtp_port)
+            self._enable_keepalive(smtp_client.sock)
+            smtp_client.ehlo()
+            smtp_client.starttls()
+            smtp_client.ehlo()
+            smtp_client.login(self.username, self.password)
             logger.info(f"Connected to SMTP server {self.smtp_server}")
-            return True
+            return smtp_client
         except Exception as e:
             logger.error(f"Failed to connect to SMTP server: {str(e)}")
-            return False
+            return None
+    
+    def _enable_keepalive(self, sock: socket.socket):
+        """Turn on TCP keepalive so NATs and firewalls don't drop the idle connection."""
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, TCP_KEEPALIVE_IDLE)
     
     def disconnect(self):
         """Disconnect from both IMAP and SMTP servers."""
+        self._disconnect_imap()
+        self._disconnect_smtp()
+    
+    def _disconnect_imap(self):
+        """Disconnect from the IMAP server."""
         if self.imap_client:
             try:
                 self.imap_client.close()
@@ -71,15 +184,25 @@ class EmailService:
                 logger.error(f"Error disconnecting from IMAP server: {str(e)}")
             finally:
                 self.imap_client = None
-                
-        if self.smtp_client:
+    
+    def _disconnect_smtp(self):
+        """Close every pooled SMTP session."""
+        # Drain the pool first: it is LIFO, so putting None back as we go would
+        # hand the same empty slot straight back to the next get()
+        smtp_clients = [self.smtp_pool.get() for _ in range(self.smtp_pool_size)]
+        for smtp_client in smtp_clients:
+            self._close_smtp(smtp_client)
+        for _ in range(self.smtp_pool_size):
+            self.smtp_pool.put(None)
+    
+    def _close_smtp(self, smtp_client: Optional[smtplib.SMTP]):
+        """Quit a single SMTP session, ignoring errors from a dead connection."""
+        if smtp_client:
             try:
-                self.smtp_client.quit()
+                smtp_client.quit()
                 logger.info("Disconnected from SMTP server")
             except Exception as e:
                 logger.error(f"Error disconnecting from SMTP server: {str(e)}")
-            finally:
-                self.smtp_client = None
     
     def fetch_new_emails(self) -> List[EmailMessage]:
         """Fetch new emails from the inbox."""
@@ -88,53 +211,70 @@ class EmailService:
         
         emails = []
         
+        # Anything fetched earlier but never committed is fetched again
+        self._fetched_uid = self.last_uid
+        
         try:
-            # Select the inbox
-            self.imap_client.select("INBOX")
-            
             # Create search criteria for new emails
-            since_date = self.last_check_time.strftime("%d-%b-%Y")
-            search_criteria = f'(SINCE "{since_date}")'
+            if self.last_uid:
+                search_criteria = f"UID {self.last_uid + 1}:*"
+            else:
+                # No usable last UID yet, so fall back to a date search
+                since_date = self.last_check_time.strftime("%d-%b-%Y")
+                search_criteria = f'(SINCE "{since_date}")'
             
             # Search for matching emails
-            status, messages = self.imap_client.search(None, search_criteria)
+            status, messages = self.imap_client.uid("SEARCH", None, search_criteria)
             
             if status != "OK":
                 logger.warning(f"No messages found or search failed with status: {status}")
                 return []
             
-            # Convert message IDs to a list
-            message_ids = messages[0].split()
+            # "N:*" always matches the newest message, even when it was already seen
+            uids = [uid for uid in messages[0].split() if int(uid) > self.last_uid]
             
             # Update the last check time
             self.last_check_time = datetime.now()
             
-            # Process each message
-            for msg_id in message_ids:
-                email_obj = self._fetch_email_by_id(msg_id)
-                if email_obj:
-                    emails.append(email_obj)
+            # Fetch messages in bulk, one round-trip per chunk instead of per message
+            for start in range(0, len(uids), FETCH_CHUNK_SIZE):
+                chunk = uids[start:start + FETCH_CHUNK_SIZE]
+                # BODY.PEEK[] returns the same full message as RFC822 without setting \Seen
+                status, msg_data = self.imap_client.uid("FETCH", b",".join(chunk), "(BODY.PEEK[])")
+                
+                if status != "OK":
+                    # Stop here so the fetched UID never skips messages that weren't fetched
+                    logger.warning(f"Failed to fetch messages {chunk[0]}-{chunk[-1]}, retrying next poll")
+                    break
+                
+                # Message parts come back as (envelope, raw_email) tuples separated by b")"
+                for item in msg_data:
+                    if not isinstance(item, tuple):
+                        continue
+                    match = _FETCH_UID_RE.search(item[0])
+                    msg_id = match.group(1) if match else item[0].split()[0]
+                    email_obj = self._parse_raw_email(msg_id, item[1])
+                    if email_obj:
+                        emails.append(email_obj)
+                
+                self._fetched_uid = max(self._fetched_uid, max(int(uid) for uid in chunk))
             
             logger.info(f"Retrieved {len(emails)} new emails")
             
+        except (imaplib.IMAP4.error, OSError) as e:
+            # Covers aborts as well as commands rejected in the wrong state
+            logger.error(f"IMAP error while fetching emails, reconnecting: {str(e)}")
+            self._disconnect_imap()
+            self.connect_imap()
+        
         except Exception as e:
             logger.error(f"Error fetching emails: {str(e)}")
-            # Try to reconnect
-            self.disconnect()
-            self.connect_imap()
         
         return emails
     
-    def _fetch_email_by_id(self, msg_id: bytes) -> Optional[EmailMessage]:
-        """Fetch a specific email by ID."""
+    def _parse_raw_email(self, msg_id: bytes, raw_email: bytes) -> Optional[EmailMessage]:
+        """Parse a fetched RFC822 message into an EmailMessage."""
         try:
-            status, msg_data = self.imap_client.fetch(msg_id, "(RFC822)")
-            
-            if status != "OK":
-                logger.warning(f"Failed to fetch message {msg_id}")
-                return None
-            
-            raw_email = msg_data[0][1]
             email_message = email.message_from_bytes(raw_email)
             
             # Extract basic headers
@@ -152,11 +292,8 @@ class EmailService:
                 cc_str = self._decode_header(email_message["Cc"])
                 cc = [addr.strip() for addr in cc_str.split(",")]
             
-            # Extract body
-            body = self._get_email_body(email_message)
-            
-            # Extract attachments
-            attachments = self._get_attachments(email_message)
+            # Extract body and attachment metadata in a single pass
+            body, attachments = self._parse_mime(email_message)
             
             # Parse date
             try:
@@ -172,7 +309,7 @@ class EmailService:
                 recipient=recipient,
                 body=body,
                 date=date_obj,
-                raw_content=raw_email.decode('utf-8', errors='replace'),
+                raw_content=raw_email,
                 cc=cc,
                 attachments=attachments,
                 references=references,
@@ -188,163 +325,244 @@ class EmailService:
         """Decode email header."""
         if header is None:
             return ""
-            
-        decoded_header = decode_header(header)[0][0]
-        if isinstance(decoded_header, bytes):
-            try:
-                return decoded_header.decode()
-            except:
-                return decoded_header.decode("latin1")
-        return decoded_header
-    
-    def _get_email_body(self, msg: email.message.Message) -> str:
-        """Extract the email body from a message."""
-        body = ""
-        
-        if msg.is_multipart():
-            # Handle multipart messages
-            for part in msg.walk():
-                content_type = part.get_content_type()
-                content_disposition = str(part.get("Content-Disposition"))
-                
-                # Skip attachments
-                if "attachment" in content_disposition:
-                    continue
-                
-                # Get the body text (prefer plain text)
-                if content_type == "text/plain":
-                    try:
-                        body = part.get_payload(decode=True).decode()
-                        break
-                    except:
-                        pass
-                elif content_type == "text/html" and not body:
-                    try:
-                        body = part.get_payload(decode=True).decode()
-                    except:
-                        pass
-        else:
-            # Handle non-multipart messages
+        
+        try:
+            chunks = decode_header(header)
+        except email.errors.HeaderParseError:
+            # Malformed encoded-word
+            return str(header)
+        
+        # Reassemble every encoded-word, not just the first chunk
+        try:
+            return str(make_header(chunks))
+        except (LookupError, UnicodeDecodeError):
+            # One chunk has an unknown or wrong charset; decode chunk by chunk so the rest survive
+            return "".join(self._decode_header_chunk(value, charset) for value, charset in chunks)
+    
+    def _decode_header_chunk(self, value, charset: Optional[str]) -> str:
+        """Decode one (value, charset) pair from decode_header as leniently as possible."""
+        if isinstance(value, str):
+            return value
+        
+        if charset:
             try:
-                body = msg.get_payload(decode=True).decode()
-            except:
-                body = msg.get_payload()
+                return value.decode(charset, errors="replace")
+            except LookupError:
+                # Unknown charset name
+                pass
         
-        return body
+        try:
+            return value.decode("utf-8")
+        except UnicodeDecodeError:
+            return value.decode("latin1")
     
-    def _get_attachments(self, msg: email.message.Message) -> List[Dict[str, Any]]:
-        """Extract attachments from an email message."""
+    def _parse_mime(self, msg: email.message.Message) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Walk the MIME tree once, extracting the body text and attachment metadata.
+        
+        Attachments are recorded by their position in the walk rather than by their part,
+        so the parsed tree can be freed; EmailMessage.load_attachment re-parses
+        raw_content to decode one on demand. Attachments over max_attachment_size keep
+        their metadata but can't be loaded.
+        
+        Args:
+            msg: The parsed email message
+            
+        Returns:
+            The body text and a list of attachment metadata dicts
+        """
         attachments = []
         
         if not msg.is_multipart():
-            return attachments
+            # Handle non-multipart messages
+            return self._decode_body_part(msg), attachments
         
-        for part in msg.walk():
+        # Pick the body part first so only that one payload is decoded
+        plain_part = None
+        html_part = None
+        for part_index, part in enumerate(msg.walk()):
+            content_type = part.get_content_type()
             content_disposition = str(part.get("Content-Disposition"))
             
             if "attachment" in content_disposition:
                 filename = part.get_filename()
                 if filename:
-                    content_type = part.get_content_type()
-                    payload = part.get_payload(decode=True)
-                    
+                    size = self._estimate_payload_size(part)
+                    if size > self.max_attachment_size:
+                        logger.warning(f"Skipping oversized attachment {filename} ({size} bytes)")
                     attachments.append({
                         "filename": filename,
                         "content_type": content_type,
-                        "data": payload
+                        "size": size,
+                        "part_index": part_index if size <= self.max_attachment_size else None
                     })
+                continue
+            
+            if content_type == "text/plain" and plain_part is None:
+                plain_part = part
+            elif content_type == "text/html" and html_part is None:
+                html_part = part
+        
+        # Prefer plain text, falling back to HTML
+        body_part = plain_part if plain_part is not None else html_part
+        body = self._decode_body_part(body_part) if body_part is not None else ""
+        
+        return body, attachments
+    
+    def _estimate_payload_size(self, part: email.message.Message) -> int:
+        """Estimate a part's decoded size from its encoded payload without decoding it."""
+        payload = part.get_payload()
+        if not isinstance(payload, str):
+            # Nested messages have no payload of their own
+            return 0
+        
+        if part.get("Content-Transfer-Encoding", "").strip().lower() == "base64":
+            return len(payload) * 3 // 4
+        return len(payload)
+    
+    def _decode_body_part(self, part: email.message.Message) -> str:
+        """Decode a text part using its declared charset."""
+        payload = part.get_payload(decode=True)
+        if payload is None:
+            return part.get_payload()
         
-        return attachments
+        charset = part.get_content_charset() or "utf-8"
+        try:
+            return payload.decode(charset, errors="replace")
+        except LookupError:
+            # Unknown charset name
+            return payload.decode("utf-8", errors="replace")
     
     def send_email(self, to: str, subject: str, body: str, cc: List[str] = None, 
                   reply_to: str = None, attachments: List[Dict[str, Any]] = None) -> bool:
-        """Send an email."""
-        if not self.smtp_client and not self.connect_smtp():
-            return False
+        """
+        Send an email. Safe to call from several threads at once: up to
+        smtp_pool_size sends run in parallel, each on its own SMTP session.
+        """
+        return self.send_emails([{
+            "to": to,
+            "subject": subject,
+            "body": body,
+            "cc": cc,
+            "reply_to": reply_to,
+            "attachments": attachments
+        }])[0]
+    
+    def send_emails(self, batch: List[Dict[str, Any]]) -> List[bool]:
+        """
+        Send several emails over a single pooled SMTP session. smtplib pipelines
+        the commands of each transaction when the server advertises PIPELINING.
         
-        try:
-            # Create message
-            msg = MIMEMultipart()
-            msg["From"] = self.username
-            msg["To"] = to
-            msg["Subject"] = subject
-            
-            if cc:
-                msg["Cc"] = ", ".join(cc)
-                recipients = [to] + cc
-            else:
-                recipients = [to]
-            
-            if reply_to:
-                msg["Reply-To"] = reply_to
-            
-            # Add personalized signature
-            email_body = body
-            if COURSE_INFO["email_signature"]:
-                signature = COURSE_INFO["email_signature"].format(
-                    ta_name=COURSE_INFO["ta_name"],
-                    course_name=COURSE_INFO["name"]
-                )
-                email_body += signature
-            
-            msg.attach(MIMEText(email_body, "plain"))
-            
-            # Add attachments
-            if attachments:
-                for attachment in attachments:
-                    part = MIMEText(attachment["data"])
-                    part.add_header(
-                        "Content-Disposition",
-                        f"attachment; filename= {attachment['filename']}",
-                    )
-                    msg.attach(part)
+        Args:
+            batch: Keyword arguments for send_email, one dict per email
             
-            # Send the email
-            self.smtp_client.sendmail(self.username, recipients, msg.as_string())
-            logger.info(f"Email sent to {to}")
-            return True
+        Returns:
+            Whether each email was sent, in the same order
+        """
+        results = []
+        smtp_client = self.smtp_pool.get()
+        try:
+            for kwargs in batch:
+                sent, smtp_client = self._send_email(smtp_client, **kwargs)
+                results.append(sent)
+        finally:
+            self.smtp_pool.put(smtp_client)
+        return results
+    
+    def _send_email(self, smtp_client: Optional[smtplib.SMTP], to: str, subject: str, body: str,
+                   cc: List[str] = None, reply_to: str = None,
+                   attachments: List[Dict[str, Any]] = None) -> Tuple[bool, Optional[smtplib.SMTP]]:
+        """
+        Send an email over a checked-out SMTP session.
         
+        Returns:
+            Whether the email was sent, and the session to return to the pool
+        """
+        try:
+            # Serialize once so a retry resends the same bytes
+            msg, recipients = self._build_message(to, subject, body, cc, reply_to, attachments)
+            msg_bytes = msg.as_bytes()
         except Exception as e:
-            logger.error(f"Error sending email: {str(e)}")
-            # Try to reconnect
-            try:
-                self.disconnect()
-                if self.connect_smtp():
-                    # Try again
-                    msg = MIMEMultipart()
-                    msg["From"] = self.username
-                    msg["To"] = to
-                    msg["Subject"] = subject
-                    
-                    if cc:
-                        msg["Cc"] = ", ".join(cc)
-                        recipients = [to] + cc
-                    else:
-                        recipients = [to]
-                    
-                    if reply_to:
-                        msg["Reply-To"] = reply_to
-                    
-                    # Add personalized signature
-                    email_body = body
-                    if COURSE_INFO["email_signature"]:
-                        signature = COURSE_INFO["email_signature"].format(
-                            ta_name=COURSE_INFO["ta_name"],
-                            course_name=COURSE_INFO["name"]
-                        )
-                        email_body += signature
-                    
-                    msg.attach(MIMEText(email_body, "plain"))
-                    
-                    # Send the email
-                    self.smtp_client.sendmail(self.username, recipients, msg.as_string())
-                    logger.info(f"Email sent to {to} on second attempt")
-                    return True
-            except Exception as e2:
-                logger.error(f"Error sending email on second attempt: {str(e2)}")
-                return False
+            logger.error(f"Error building email to {to}: {str(e)}")
+            return False, smtp_client
+        
+        sent, smtp_client = self._send_with_retry(smtp_client, self.username, recipients, msg_bytes)
+        if sent:
+            logger.info(f"Email sent to {to}")
+        return sent, smtp_client
+    
+    def _build_message(self, to: str, subject: str, body: str, cc: List[str] = None,
+                       reply_to: str = None,
+                       attachments: List[Dict[str, Any]] = None) -> Tuple[MIMEMultipart, List[str]]:
+        """Build an outgoing message and its list of envelope recipients."""
+        # Create message
+        msg = MIMEMultipart()
+        msg["From"] = self.username
+        msg["To"] = to
+        msg["Subject"] = subject
+        
+        if cc:
+            msg["Cc"] = ", ".join(cc)
+            recipients = [to] + cc
+        else:
+            recipients = [to]
+        
+        if reply_to:
+            msg["Reply-To"] = reply_to
+        
+        # Add personalized signature
+        msg.attach(MIMEText(body + self._signature, "plain"))
+        
+        # Add attachments as base64 so binary files survive transport intact
+        if attachments:
+            for attachment in attachments:
+                maintype, _, subtype = attachment.get("content_type", "application/octet-stream").partition("/")
+                part = MIMEBase(maintype, subtype or "octet-stream")
+                part.set_payload(attachment["data"])
+                encoders.encode_base64(part)
+                part.add_header("Content-Disposition", "attachment", filename=attachment["filename"])
+                msg.attach(part)
+        
+        return msg, recipients
+    
+    def _send_with_retry(self, smtp_client: Optional[smtplib.SMTP], sender: str, recipients: List[str],
+                         msg_bytes: bytes) -> Tuple[bool, Optional[smtplib.SMTP]]:
+        """Send serialized message bytes, reconnecting and resending once if the session dropped."""
+        return self._with_reconnect(
+            smtp_client,
+            lambda client: client.sendmail(sender, recipients, msg_bytes)
+        )
+    
+    def _with_reconnect(self, smtp_client: Optional[smtplib.SMTP],
+                        action: Callable[[smtplib.SMTP], Any]) -> Tuple[bool, Optional[smtplib.SMTP]]:
+        """
+        Run an SMTP action, reconnecting and retrying once if the server dropped the session.
+        
+        Args:
+            smtp_client: The checked-out session, or None to connect a new one
+            action: Function that performs the SMTP commands on a session
             
-            return False
+        Returns:
+            Whether the action succeeded, and the session to return to the pool
+        """
+        for attempt in range(2):
+            if not smtp_client:
+                smtp_client = self.connect_smtp()
+                if not smtp_client:
+                    return False, None
+            
+            try:
+                action(smtp_client)
+                return True, smtp_client
+            except smtplib.SMTPServerDisconnected as e:
+                logger.error(f"SMTP connection lost (attempt {attempt + 1}): {str(e)}")
+                self._close_smtp(smtp_client)
+                smtp_client = None
+            except Exception as e:
+                logger.error(f"Error sending email: {str(e)}")
+                return False, smtp_client
+        
+        return False, smtp_client
     
     def send_response(self, original_email: EmailMessage, response_text: str) -> bool:
         """Send a response to an email."""
@@ -380,6 +598,11 @@ class EmailService:
         self.monitoring_thread = threading.Thread(target=self._monitoring_loop)
         self.monitoring_thread.daemon = True
         self.monitoring_thread.start()
+        
+        # Keep the SMTP connection warm between sends
+        self.heartbeat_thread = threading.Thread(target=self._heartbeat_loop)
+        self.heartbeat_thread.daemon = True
+        self.heartbeat_thread.start()
         logger.info("Started email monitoring thread")
     
     def stop_monitoring_emails(self):
@@ -390,14 +613,107 @@ class EmailService:
             logger.info("Stopped email monitoring thread")
     
     def _monitoring_loop(self):
-        """Background thread function to check for new emails periodically."""
+        """Background thread function that fetches new emails as the server reports them."""
         while not self.stop_monitoring.is_set():
             try:
                 new_emails = self.fetch_new_emails()
                 if new_emails and self.new_email_callback:
                     self.new_email_callback(new_emails)
+                
+                # Only now are the fetched emails handled; a crash before this refetches them
+                self.commit_fetched_emails()
             except Exception as e:
                 logger.error(f"Error in email monitoring loop: {str(e)}")
             
-            # Sleep until next check
-            time.sleep(self.check_frequency)
\ No newline at end of file
+            # Wait for the server to push new mail, or poll if it can't
+            if not self._idle():
+                self.stop_monitoring.wait(self.check_frequency)
+    
+    def _idle(self) -> bool:
+        """
+        Wait in IMAP IDLE (RFC 2177) until the server reports new mail, IDLE_TIMEOUT
+        expires, or monitoring is stopped.
+        
+        Returns:
+            bool: False if IDLE is unavailable and the caller should poll instead
+        """
+        client = self.imap_client
+        if not client or "IDLE" not in client.capabilities:
+            return False
+        
+        try:
+            # imaplib has no IDLE command before Python 3.14, so speak the protocol directly
+            tag = client._new_tag()
+            client.send(tag + b" IDLE\r\n")
+            response = client.readline()
+            if not response.startswith(b"+"):
+                logger.warning(f"Server rejected IDLE: {response!r}")
+                return False
+            
+            deadline = time.monotonic() + IDLE_TIMEOUT
+            sock = client.socket()
+            while not self.stop_monitoring.is_set() and time.monotonic() < deadline:
+                # select only sees the socket, not lines imaplib or SSL already buffered
+                if not self._idle_data_buffered(client, sock):
+                    readable, _, _ = select.select([sock], [], [], IDLE_STOP_CHECK_INTERVAL)
+                    if not readable:
+                        continue
+                
+                if self._read_idle_line(client).rstrip().endswith(b"EXISTS"):
+                    break
+            
+            # End IDLE and skip any untagged responses until the command completes
+            client.send(b"DONE\r\n")
+            while not self._read_idle_line(client).startswith(tag):
+                pass
+            
+            return True
+        
+        except (imaplib.IMAP4.abort, OSError) as e:
+            logger.error(f"IMAP connection lost during IDLE: {str(e)}")
+            # Drop the dead connection; the next fetch reconnects
+            self.imap_client = None
+            return True
+    
+    def _idle_data_buffered(self, client: imaplib.IMAP4, sock: socket.socket) -> bool:
+        """Check without blocking whether a response is already readable through client.file."""
+        timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            # peek returns buffered bytes, or does one non-blocking read if the buffer is empty
+            return bool(client.file.peek())
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            sock.settimeout(timeout)
+    
+    def _read_idle_line(self, client: imaplib.IMAP4) -> bytes:
+        """Read one server response line, treating EOF as a dropped connection."""
+        line = client.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("connection closed during IDLE")
+        return line
+    
+    def _heartbeat_loop(self):
+        """
+        Background thread function that pings idle pooled SMTP sessions so they
+        aren't dropped between sends. The IMAP connection is kept alive by
+        re-issuing IDLE on the monitoring thread, which owns it.
+        """
+        while not self.stop_monitoring.wait(SMTP_HEARTBEAT_INTERVAL):
+            # Only sessions nobody has checked out are pinged; busy ones are in use
+            idle_clients = []
+            while True:
+                try:
+                    idle_clients.append(self.smtp_pool.get_nowait())
+                except queue.Empty:
+                    break
+            
+            for smtp_client in idle_clients:
+                if smtp_client:
+                    try:
+                        smtp_client.noop()
+                    except (smtplib.SMTPException, OSError) as e:
+                        logger.warning(f"SMTP heartbeat failed, will reconnect on next send: {str(e)}")
+                        smtp_client = None
+                self.smtp_pool.put(smtp_client)
\ No newline at end of file
@@ -1,12 +1,28 @@
+import hashlib
 import logging
 import json
+import os
+import re
+import threading
+from itertools import islice
 from typing import Dict, List, Tuple, Any, Optional
 import anthropic
+from cachetools import LRUCache
+from datasets import Dataset
+from setfit import SetFitModel, Trainer, TrainingArguments
 
 from config.settings import AI_CONFIG
 
 logger = logging.getLogger(__name__)
 
+# Quoted lines from earlier messages in a reply thread
+_QUOTED_LINE_RE = re.compile(r"^[ \t]*>.*\n?", re.MULTILINE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# "Intent: <category>" and "Confidence: <number>", in either order
+_INTENT_RE = re.compile(r"Intent:\s*\[?(\w+)", re.IGNORECASE)
+_CONFIDENCE_RE = re.compile(r"Confidence:\s*\[?([0-9]*\.?[0-9]+)", re.IGNORECASE)
+
 class NLPService:
     """Service for natural language processing tasks like intent classification using Claude API."""
     
@@ -22,51 +38,226 @@ class NLPService:
                 "Can you explain problem 2 in homework 4?",
                 "I'm having trouble with the last part of the lab.",
                 "What are the requirements for the final project?",
-                "Is it okay if I submit my assignment late?"
+                "Is it okay if I submit my assignment late?",
+                "Do we need to include test cases with the homework?",
+                "How many pages should the lab report be?",
+                "Can we work in pairs on project 2?"
             ],
             "grade_inquiry": [
                 "Why did I lose points on question 3?",
                 "I think there's a mistake in my midterm grade.",
                 "Can you explain the grading for the last assignment?",
                 "When will our exam grades be posted?",
-                "How is the final grade calculated?"
+                "How is the final grade calculated?",
+                "My quiz score on the portal looks wrong.",
+                "Is there a curve on the midterm?",
+                "Could you regrade my last submission?"
             ],
             "conceptual_question": [
                 "Can you explain how recursion works?",
                 "I'm confused about the difference between arrays and linked lists.",
                 "What's the time complexity of quicksort?",
                 "How does inheritance work in object-oriented programming?",
-                "Could you elaborate on the concept discussed in lecture 5?"
+                "Could you elaborate on the concept discussed in lecture 5?",
+                "Why does a hash table have constant-time lookup?",
+                "What is the difference between a stack and a queue?",
+                "I don't understand how dynamic programming avoids recomputation."
             ],
             "administrative": [
                 "When are your office hours?",
                 "Can I schedule a meeting to discuss my progress?",
                 "Will class be canceled next Monday?",
                 "Where can I find the syllabus?",
-                "How do I join the course Discord?"
+                "How do I join the course Discord?",
+                "Is attendance mandatory for the discussion sections?",
+                "Which room is the final exam in?",
+                "Can I switch to a different lab section?"
             ],
             "technical_issue": [
                 "The course website isn't loading for me.",
                 "I can't submit my assignment through the portal.",
                 "The autograder is giving me an error.",
                 "My code works locally but fails on the submission system.",
-                "I'm having trouble accessing the lecture videos."
+                "I'm having trouble accessing the lecture videos.",
+                "My Gradescope account is not linked to the course.",
+                "The starter code fails to compile on my machine.",
+                "I get a permission denied error when cloning the repo."
             ],
             "personal_circumstance": [
                 "I have a medical appointment during the next exam.",
                 "I've been sick and couldn't complete the assignment.",
                 "Can I get an extension due to family emergency?",
                 "I need accommodations for my disability.",
-                "I'll be representing the university at a conference next week."
+                "I'll be representing the university at a conference next week.",
+                "I'm going through a difficult time and falling behind.",
+                "I have a religious holiday on the day of the quiz.",
+                "I was in the hospital last week and missed the lab."
             ],
             "other": [
                 "Just wanted to say thanks for your help!",
                 "Could you forward this to the professor?",
                 "I'm interested in research opportunities in this field.",
                 "Can you recommend resources for learning more about this topic?",
-                "I noticed a typo in the lecture slides."
+                "I noticed a typo in the lecture slides.",
+                "Thanks for the great lecture today!",
+                "Are you hiring TAs for next semester?",
+                "Do you know any good clubs related to programming?"
             ]
         }
+        
+        # Local few-shot classifier; Claude is only consulted when it is unsure
+        self.intent_labels = list(self.intents)
+        self.intent_confidence_threshold = AI_CONFIG["intent_confidence_threshold"]
+        self.intent_model = self._load_intent_model()
+        
+        # Claude classifications keyed by a hash of the normalized email text
+        self._intent_cache = LRUCache(maxsize=AI_CONFIG["intent_cache_size"])
+        self._intent_cache_lock = threading.Lock()
+        self.intent_batch_size = max(1, AI_CONFIG["intent_batch_size"])
+        
+        # The categories and examples never change, so build that prompt section once
+        self._classification_guide = self._build_classification_guide()
+    
+    def _load_intent_model(self) -> SetFitModel:
+        """Load the SetFit intent classifier, fine-tuning it on the intent examples on first use."""
+        model_path = AI_CONFIG["intent_model_path"]
+        if os.path.isdir(model_path):
+            return SetFitModel.from_pretrained(model_path)
+        
+        logger.info("Fine-tuning intent classifier on intent examples")
+        texts, labels = [], []
+        for label, example_list in enumerate(self.intents.values()):
+            texts.extend(example_list)
+            labels.extend([label] * len(example_list))
+        
+        model = SetFitModel.from_pretrained(AI_CONFIG["intent_base_model"])
+        trainer = Trainer(
+            model=model,
+            args=TrainingArguments(num_epochs=1),
+            train_dataset=Dataset.from_dict({"text": texts, "label": labels})
+        )
+        trainer.train()
+        model.save_pretrained(model_path)
+        return model
+    
+    def classify_intent_fast(self, email_subject: str, email_body: str) -> Tuple[str, float]:
+        """
+        Classify the intent of an email with the local SetFit model, falling back
+        to Claude when the model's confidence is below the threshold.
+        
+        Args:
+            email_subject: The subject line of the email
+            email_body: The body text of the email
+            
+        Returns:
+            Tuple containing (intent_category, confidence_score)
+        """
+        return self.classify_intent_batch([email_subject], [email_body])[0]
+    
+    def classify_intent_batch(self, email_subjects: List[str], email_bodies: List[str]) -> List[Tuple[str, float]]:
+        """
+        Classify several emails with one forward pass of the local SetFit model.
+        Emails the model is unsure about are classified together with Claude.
+        
+        Args:
+            email_subjects: The subject lines of the emails
+            email_bodies: The body texts of the emails, in the same order
+            
+        Returns:
+            List of (intent_category, confidence_score) tuples, one per email
+        """
+        texts = [f"{subject}\n{body}" for subject, body in zip(email_subjects, email_bodies)]
+        
+        try:
+            probabilities = self.intent_model.predict_proba(texts, as_numpy=True)
+        except Exception as e:
+            logger.error(f"Error classifying email intents locally: {str(e)}")
+            return self.classify_intents(list(zip(email_subjects, email_bodies)))
+        
+        results = []
+        unsure = []  # Indexes of emails to send to Claude
+        for i, row in enumerate(probabilities):
+            best = int(row.argmax())
+            confidence = float(row[best])
+            
+            if confidence < self.intent_confidence_threshold:
+                logger.info(f"Local intent confidence {confidence:.2f} too low, falling back to Claude")
+                results.append(None)
+                unsure.append(i)
+            else:
+                intent = self.intent_labels[best]
+                logger.info(f"Classified email intent locally as '{intent}' with confidence {confidence}")
+                results.append((intent, confidence))
+        
+        if unsure:
+            fallback = self.classify_intents([(email_subjects[i], email_bodies[i]) for i in unsure])
+            for i, result in zip(unsure, fallback):
+                results[i] = result
+        
+        return results
+    
+    def classify_intents(self, batch: List[Tuple[str, str]]) -> List[Tuple[str, float]]:
+        """
+        Classify several emails with Claude, sending up to intent_batch_size
+        emails per API call so they share the prompt and examples.
+        
+        Args:
+            batch: List of (email_subject, email_body) tuples
+            
+        Returns:
+            List of (intent_category, confidence_score) tuples, one per email
+        """
+        results = [None] * len(batch)
+        
+        # Serve repeats from the cache
+        misses = []
+        with self._intent_cache_lock:
+            for i, (subject, body) in enumerate(batch):
+                cache_key = self._intent_cache_key(subject, body)
+                cached = self._intent_cache.get(cache_key)
+                if cached is not None:
+                    results[i] = cached
+                else:
+                    misses.append((i, cache_key))
+        
+        for start in range(0, len(misses), self.intent_batch_size):
+            chunk = misses[start:start + self.intent_batch_size]
+            if len(chunk) == 1:
+                i, _ = chunk[0]
+                results[i] = self.classify_intent(*batch[i])
+                continue
+            
+            classifications = self._classify_intent_chunk([batch[i] for i, _ in chunk])
+            with self._intent_cache_lock:
+                for (i, cache_key), (intent, confidence) in zip(chunk, classifications):
+                    results[i] = (intent, confidence)
+                    if confidence > 0:
+                        self._intent_cache[cache_key] = (intent, confidence)
+        
+        return results
+    
+    def _classify_intent_chunk(self, batch: List[Tuple[str, str]]) -> List[Tuple[str, float]]:
+        """Classify a chunk of emails with a single Claude call."""
+        try:
+            prompt = self._create_batch_classification_prompt(batch)
+            
+            response = self.client.messages.create(
+                model=self.model,
+                max_tokens=50 + 40 * len(batch),
+                temperature=0.2,  # Low temperature for consistent classification
+                system="You are an expert teaching assistant helping classify student emails.",
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            )
+            
+            classifications = self._parse_batch_classification_result(response.content[0].text, len(batch))
+            logger.info(f"Classified {len(batch)} email intents with one Claude call")
+            return classifications
+            
+        except Exception as e:
+            logger.error(f"Error classifying email intents with Claude: {str(e)}")
+            return [("other", 0.0)] * len(batch)
     
     def classify_intent(self, email_subject: str, email_body: str) -> Tuple[str, float]:
         """
@@ -79,6 +270,14 @@ class NLPService:
         Returns:
             Tuple containing (intent_category, confidence_score)
         """
+        # Resends and replies with the same text skip the API call
+        cache_key = self._intent_cache_key(email_subject, email_body)
+        with self._intent_cache_lock:
+            cached = self._intent_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Using cached intent '{cached[0]}' with confidence {cached[1]}")
+            return cached
+        
         try:
             # Prepare the prompt for classification
             prompt = self._create_classification_prompt(email_subject, email_body)
@@ -101,23 +300,32 @@ class NLPService:
             intent, confidence = self._parse_classification_result(result_text)
             
             logger.info(f"Classified email intent as '{intent}' with confidence {confidence}")
+            
+            # Unparseable responses come back with zero confidence; don't pin them
+            if confidence > 0:
+                with self._intent_cache_lock:
+                    self._intent_cache[cache_key] = (intent, confidence)
             return intent, confidence
             
         except Exception as e:
             logger.error(f"Error classifying email intent with Claude: {str(e)}")
             return "other", 0.0
     
-    def _create_classification_prompt(self, email_subject: str, email_body: str) -> str:
-        """Create a prompt for the classification model."""
-        # Create examples section
-        examples = ""
-        for intent, example_list in self.intents.items():
-            for example in example_list[:2]:  # Use just a couple examples per category
-                examples += f"Example: \"{example}\"\nIntent: {intent}\n\n"
-        
-        # Create the full prompt
-        prompt = f"""Classify the following student email into exactly one of these categories:
-- assignment_question: Questions about homework, projects, or assignments
+    def _intent_cache_key(self, email_subject: str, email_body: str) -> bytes:
+        """Hash the email text with quoted replies, case and spacing normalized away."""
+        body = _QUOTED_LINE_RE.sub("", email_body)
+        text = _WHITESPACE_RE.sub(" ", f"{email_subject}\x00{body}").strip().lower()
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    
+    def _build_classification_guide(self) -> str:
+        """Build the category list and examples shared by every classification prompt."""
+        examples = "".join(
+            f"Example: \"{example}\"\nIntent: {intent}\n\n"
+            for intent, example_list in self.intents.items()
+            for example in example_list[:2]  # Use just a couple examples per category
+        )
+        
+        return f"""- assignment_question: Questions about homework, projects, or assignments
 - grade_inquiry: Questions about grades, scoring, or feedback
 - conceptual_question: Questions about course concepts or material
 - administrative: Questions about course logistics, scheduling, or policies
@@ -128,7 +336,12 @@ class NLPService:
 Here are some examples of classifications:
 
 {examples}
-
+"""
+    
+    def _create_classification_prompt(self, email_subject: str, email_body: str) -> str:
+        """Create a prompt for the classification model."""
+        return f"""Classify the following student email into exactly one of these categories:
+{self._classification_guide}
 Now classify this email:
 Subject: {email_subject}
 Body:
@@ -140,7 +353,66 @@ Confidence: [decimal between 0 and 1]
 
 The confidence should reflect how certain you are that this is the correct classification.
 """
-        return prompt
+    
+    def _create_batch_classification_prompt(self, batch: List[Tuple[str, str]]) -> str:
+        """Create a prompt that classifies several emails at once."""
+        emails = "".join(
+            f"Email {i}:\nSubject: {subject}\nBody:\n{body}\n\n"
+            for i, (subject, body) in enumerate(batch, start=1)
+        )
+        
+        return f"""Classify each of the following student emails into exactly one of these categories:
+{self._classification_guide}
+Now classify these {len(batch)} emails:
+
+{emails}Return only a JSON array with one object per email, in the same order:
+[{{"intent": "category", "confidence": decimal between 0 and 1}}, ...]
+
+The confidence should reflect how certain you are that this is the correct classification.
+"""
+    
+    def _parse_batch_classification_result(self, result_text: str, count: int) -> List[Tuple[str, float]]:
+        """
+        Parse a JSON array of classifications from Claude.
+        
+        Args:
+            result_text: The text response from Claude
+            count: The number of emails that were classified
+            
+        Returns:
+            List of (intent, confidence) tuples, padded with ("other", 0.0) if short
+        """
+        results = []
+        
+        try:
+            # Tolerate prose or code fences around the array
+            items = json.loads(result_text[result_text.index("["):result_text.rindex("]") + 1])
+            for item in items[:count]:
+                results.append(self._validate_classification(
+                    str(item.get("intent", "other")).strip().lower(),
+                    float(item.get("confidence", 0.0))
+                ))
+        except Exception as e:
+            logger.error(f"Error parsing batch classification result: {str(e)}")
+            logger.error(f"Result text was: {result_text}")
+        
+        if len(results) < count:
+            logger.warning(f"Expected {count} classifications, got {len(results)}")
+            results.extend([("other", 0.0)] * (count - len(results)))
+        
+        return results
+    
+    def _validate_classification(self, intent: str, confidence: float) -> Tuple[str, float]:
+        """Map unknown intents to 'other' and clamp confidence to [0, 1]."""
+        if intent not in self.intents:
+            logger.warning(f"Unrecognized intent '{intent}', defaulting to 'other'")
+            intent = "other"
+        
+        if not (0 <= confidence <= 1):
+            logger.warning(f"Invalid confidence value {confidence}, clamping to range [0,1]")
+            confidence = max(0, min(confidence, 1))
+        
+        return intent, confidence
     
     def _parse_classification_result(self, result_text: str) -> Tuple[str, float]:
         """
@@ -155,33 +427,18 @@ The confidence should reflect how certain you are that this is the correct class
         intent = "other"
         confidence = 0.0
         
-        try:
-            # Extract intent
-            if "Intent:" in result_text:
-                intent_line = [line for line in result_text.split('\n') if "Intent:" in line][0]
-                intent = intent_line.split("Intent:")[1].strip().lower()
-            
-            # Extract confidence
-            if "Confidence:" in result_text:
-                confidence_line = [line for line in result_text.split('\n') if "Confidence:" in line][0]
-                confidence_str = confidence_line.split("Confidence:")[1].strip()
-                confidence = float(confidence_str)
-            
-            # Validate intent
-            if intent not in self.intents:
-                logger.warning(f"Unrecognized intent '{intent}', defaulting to 'other'")
-                intent = "other"
-                
-            # Validate confidence
-            if not (0 <= confidence <= 1):
-                logger.warning(f"Invalid confidence value {confidence}, clamping to range [0,1]")
-                confidence = max(0, min(confidence, 1))
-                
-        except Exception as e:
-            logger.error(f"Error parsing classification result: {str(e)}")
+        intent_match = _INTENT_RE.search(result_text)
+        if not intent_match:
+            logger.error("Error parsing classification result: no intent found")
             logger.error(f"Result text was: {result_text}")
+            return intent, confidence
         
-        return intent, confidence
+        intent = intent_match.group(1).lower()
+        confidence_match = _CONFIDENCE_RE.search(result_text)
+        if confidence_match:
+            confidence = float(confidence_match.group(1))
+        
+        return self._validate_classification(intent, confidence)
     
     def generate_email_response(self, email_content: str, student_info: Dict[str, Any], 
                                course_info: Dict[str, Any], intent: str) -> str:
@@ -236,10 +493,14 @@ The confidence should reflect how certain you are that this is the correct class
         # Format student conversation history if available
         conversation_history = ""
         if "conversation_history" in student_info and student_info["conversation_history"]:
-            for i, conv in enumerate(student_info["conversation_history"][-3:]):  # Last 3 conversations
-                conversation_history += f"Conversation {i+1}:\n"
-                conversation_history += f"Student: {conv.get('message', {}).get('body', 'No message')}\n"
-                conversation_history += f"TA: {conv.get('response', 'No response')}\n\n"
+            history = student_info["conversation_history"]
+            recent = islice(history, max(0, len(history) - 3), None)  # Last 3 conversations
+            conversation_history = "".join(
+                f"Conversation {i+1}:\n"
+                f"Student: {conv.get('message', {}).get('body', 'No message')}\n"
+                f"TA: {conv.get('response', 'No response')}\n\n"
+                for i, conv in enumerate(recent)
+            )
         
         # Create system prompt using the model context protocol
         system_prompt = f"""You are a helpful teaching assistant for {course_info.get('name', 'the course')}.
@@ -263,15 +524,17 @@ Term: {course_info.get('term', 'N/A')}
 """
 
         # Add any course policies or resources if available
+        sections = [system_prompt]
         if "policies" in course_info:
-            system_prompt += "\nCOURSE POLICIES:\n"
-            for policy_name, policy_text in course_info["policies"].items():
-                system_prompt += f"- {policy_name}: {policy_text}\n"
+            sections.append("\nCOURSE POLICIES:\n")
+            sections.extend(f"- {policy_name}: {policy_text}\n"
+                            for policy_name, policy_text in course_info["policies"].items())
         
         if "resources" in course_info:
-            system_prompt += "\nCOURSE RESOURCES:\n"
-            for resource_name, resource_link in course_info["resources"].items():
-                system_prompt += f"- {resource_name}: {resource_link}\n"
+            sections.append("\nCOURSE RESOURCES:\n")
+            sections.extend(f"- {resource_name}: {resource_link}\n"
+                            for resource_name, resource_link in course_info["resources"].items())
+        system_prompt = "".join(sections)
         
         # Create user prompt with the specific email content
         user_prompt = f"""I'm responding to a student email with the intent classified as: {intent}
@@ -0,0 +1,161 @@
+import logging
+import re
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from config.settings import CACHE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Intents whose answers are the same for every student. Grade inquiries and
+# personal circumstances are student-specific and are never cached.
+CACHEABLE_INTENTS = {
+    "assignment_question",
+    "conceptual_question",
+    "administrative",
+    "technical_issue"
+}
+
+# Greeting and sign-off lines carry the student's name, not the question
+_GREETING_RE = re.compile(
+    r"^\s*(hi|hello|hey|dear|good (morning|afternoon|evening))\b[^\n]*\n",
+    re.IGNORECASE
+)
+# A closing line at the very end, followed by at most a few short name lines.
+# Anything else after the closing (e.g. a question) means it isn't a sign-off.
+_SIGNOFF_RE = re.compile(
+    r"\n[ \t]*(best|regards|kind regards|thanks|thank you|sincerely|cheers)\b[ \w]{0,15}[,.!]?[ \t]*"
+    r"(\n[ \t]*([^\W\d_][\w.'-]*([ \t]+[^\W\d_][\w.'-]*){0,2})?[ \t]*){0,3}\Z",
+    re.IGNORECASE
+)
+
+# Stands in for the student's name inside cached draft responses
+_NAME_PLACEHOLDER = "\x00student_name\x00"
+
+
+def _strip_boilerplate(email_body: str) -> str:
+    """Remove the greeting line and a trailing sign-off block from an email body."""
+    return _SIGNOFF_RE.sub("", _GREETING_RE.sub("", email_body)).strip()
+
+
+class SemanticResponseCache:
+    """
+    Cache of intent classifications and draft responses keyed by an embedding
+    of the email text, so near-duplicate questions skip the LLM round-trip.
+    """
+
+    def __init__(self):
+        self.model = SentenceTransformer(CACHE_CONFIG["embedding_model"])
+        self.threshold = CACHE_CONFIG["similarity_threshold"]
+        self.max_entries = CACHE_CONFIG["max_entries"]
+        self.ttl = CACHE_CONFIG["ttl"]
+        self.min_body_chars = CACHE_CONFIG["min_body_chars"]
+
+        # Ring buffer of normalized embeddings with a parallel list of entries
+        dimension = self.model.get_sentence_embedding_dimension()
+        self._embeddings = np.zeros((self.max_entries, dimension), dtype=np.float32)
+        self._entries = [None] * self.max_entries
+        self._size = 0
+        self._next_slot = 0
+        self._lock = threading.Lock()
+
+    def is_cacheable(self, email_body: str) -> bool:
+        """
+        Whether an email has enough content to be matched against the cache.
+        Bodies that are little more than a greeting and sign-off would be
+        matched on the subject line alone.
+        """
+        return len(_strip_boilerplate(email_body)) >= self.min_body_chars
+
+    def embed(self, email_subject: str, email_body: str) -> np.ndarray:
+        """Embed an email with the greeting and signature stripped."""
+        return self.embed_batch([email_subject], [email_body])[0]
+
+    def embed_batch(self, email_subjects: List[str], email_bodies: List[str]) -> np.ndarray:
+        """Embed several emails in a single forward pass, one row per email."""
+        texts = [
+            f"{subject}\n{_strip_boilerplate(body)}"
+            for subject, body in zip(email_subjects, email_bodies)
+        ]
+        return self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True)
+
+    def lookup(self, embedding: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Find the closest cached entry above the similarity threshold.
+
+        Args:
+            embedding: Normalized embedding returned by embed()
+
+        Returns:
+            The cached entry (intent, confidence, draft_response) or None
+        """
+        with self._lock:
+            if self._size == 0:
+                return None
+
+            # Inner product of normalized vectors is cosine similarity
+            scores = self._embeddings[:self._size] @ embedding
+            slot = int(np.argmax(scores))
+            entry = self._entries[slot]
+
+            if scores[slot] <= self.threshold or entry is None:
+                return None
+
+            if entry["expires"] < time.time():
+                self._entries[slot] = None
+                return None
+
+            return entry
+
+    def add(self, embedding: np.ndarray, intent: str, confidence: float,
+            draft_response: str, student_name: str = ""):
+        """
+        Store a draft response, replacing the oldest entry once the cache is full.
+
+        Args:
+            embedding: Normalized embedding returned by embed()
+            intent: The classified intent
+            confidence: The confidence score of the intent classification
+            draft_response: The generated response text
+            student_name: Name of the student the draft was written for
+        """
+        if intent not in CACHEABLE_INTENTS or not draft_response:
+            return
+
+        entry = {
+            "intent": intent,
+            "confidence": confidence,
+            "draft_response": self._anonymize(draft_response, student_name),
+            "expires": time.time() + self.ttl
+        }
+
+        with self._lock:
+            slot = self._next_slot
+            self._embeddings[slot] = embedding
+            self._entries[slot] = entry
+            self._next_slot = (slot + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def personalize(self, entry: Dict[str, Any], student_name: str = "") -> str:
+        """Fill a cached draft response in for a specific student."""
+        first_name = student_name.split()[0] if student_name.strip() else "there"
+        return entry["draft_response"].replace(_NAME_PLACEHOLDER, first_name)
+
+    def _anonymize(self, draft_response: str, student_name: str) -> str:
+        """Replace the student's full and first name with a placeholder."""
+        full_name = student_name.strip()
+        if len(full_name) < 2:
+            return draft_response
+
+        # Full name goes first so it wins over the first-name alternative
+        names = [full_name]
+        first_name = full_name.split()[0]
+        if first_name != full_name and len(first_name) > 1:
+            names.append(first_name)
+
+        pattern = re.compile("|".join(rf"\b{re.escape(name)}\b" for name in names))
+        return pattern.sub(_NAME_PLACEHOLDER, draft_response)
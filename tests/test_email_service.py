@@ -0,0 +1,74 @@
+from unittest import mock
+
+import pytest
+
+from services.email_service import EmailService
+
+
+@pytest.fixture
+def service():
+    with mock.patch.object(EmailService, "_load_state"):
+        return EmailService()
+
+
+def test_disconnect_quits_every_pooled_smtp_session(service):
+    sessions = [mock.Mock() for _ in range(service.smtp_pool_size)]
+    for _ in range(service.smtp_pool_size):
+        service.smtp_pool.get()
+    for session in sessions:
+        service.smtp_pool.put(session)
+
+    service.disconnect()
+
+    for session in sessions:
+        session.quit.assert_called_once()
+    assert [service.smtp_pool.get() for _ in range(service.smtp_pool_size)] == [None] * service.smtp_pool_size
+
+
+def test_sends_reuse_pooled_session(service):
+    with mock.patch.object(service, "connect_smtp", side_effect=lambda: mock.Mock()) as connect:
+        assert service.send_email("student@university.edu", "Subject", "Body")
+        assert service.send_email("student@university.edu", "Subject", "Body")
+
+    # The second send reuses the session the first one returned to the pool
+    assert connect.call_count == 1
+
+
+def _fake_imap(uids):
+    raw = b"From: Student <student@university.edu>\r\nSubject: Question\r\n\r\nBody\r\n"
+    imap = mock.Mock()
+
+    def uid(command, *args):
+        if command == "SEARCH":
+            return "OK", [b" ".join(str(u).encode() for u in uids)]
+        return "OK", [(b"1 (UID %s BODY[] {%d}" % (u, len(raw)), raw) for u in args[0].split(b",")]
+
+    imap.uid.side_effect = uid
+    return imap
+
+
+def test_fetched_uid_is_only_saved_after_callback_handles_emails(service):
+    service.imap_client = _fake_imap([10, 11])
+    service.last_uid = 9
+
+    with mock.patch.object(service, "_save_state") as save_state:
+        emails = service.fetch_new_emails()
+        assert len(emails) == 2
+        assert service.last_uid == 9
+        save_state.assert_not_called()
+
+        service.commit_fetched_emails()
+        assert service.last_uid == 11
+        save_state.assert_called_once()
+
+
+def test_uncommitted_fetch_is_refetched(service):
+    service.imap_client = _fake_imap([10, 11])
+    service.last_uid = 9
+
+    service.fetch_new_emails()
+    assert len(service.fetch_new_emails()) == 2
+
+
+def test_decode_header_keeps_valid_words_next_to_unknown_charset(service):
+    assert service._decode_header("=?x-bogus?Q?abc?= and =?utf-8?q?d=C3=A9f?=") == "abc and déf"
@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("sentence_transformers")
+
+from services.response_cache import _strip_boilerplate
+
+
+def test_thanks_before_question_keeps_question():
+    body = "Hi Professor,\n\nThanks!\nCan I get an extension on project 2?\n\nBob"
+    assert "Can I get an extension on project 2?" in _strip_boilerplate(body)
+
+
+def test_only_trailing_signoff_is_stripped():
+    body = "Hello,\n\nThank you in advance.\nWhen is the HW3 deadline?\n\nBest,\nAlice"
+    stripped = _strip_boilerplate(body)
+    assert "When is the HW3 deadline?" in stripped
+    assert "Alice" not in stripped
+
+
+def test_signoff_with_name_is_stripped():
+    assert _strip_boilerplate("Hi,\nWhat is recursion?\nThanks,\nBob Smith") == "What is recursion?"